@@ -3,6 +3,7 @@ Simulation of a Pizza Restaurant. Cooking and delivery.
 """
 
 import simpy
+import heapq
 from random import random
 from numpy import average
 import numpy as np
@@ -17,16 +18,63 @@ OVEN_CAPACITY = 4
 
 
 def utilization_rate(time_stamps):
-    differences = [(0, time_stamps[0][0])]
-    for y in range(len(time_stamps) - 1):
-        if time_stamps[y][1] < time_stamps[y + 1][0]:
-            differences.append((time_stamps[y][1], time_stamps[y + 1][0]))
-
-    util = 0
-    for i, j in differences:
-        resting_time = j - i
-        util += resting_time
-    return round((100 - util / TIME * 100), 2)
+    """ Percentage of TIME that is not spent idle, given (start, end) time stamps in the order they were recorded.
+    Several runs can be stacked along a leading axis, with shorter runs padded at the end with NaN."""
+    time_stamps = np.asarray(time_stamps)
+    starts = time_stamps[..., 0]
+    ends = time_stamps[..., 1]
+    # Idle before the first start, plus every gap between one end and the next start
+    util = starts[..., 0] + np.nansum(np.maximum(0, starts[..., 1:] - ends[..., :-1]), axis=-1)
+    return np.round((100 - util / TIME * 100), 2)
+
+
+def histogram(values, title):
+    """ Plots a histogram of values (a NumPy array) into the current figure"""
+    counts, edges = np.histogram(values)
+    plt.bar(edges[:-1], counts, width=np.diff(edges), align="edge")
+    plt.title(title)
+
+
+def run_batch(reps, number_of_drivers, order_rate, delivery_radius):
+    """ Runs the restaurant `reps` times without SimPy, for the Monte Carlo estimates of part B.
+
+    Orders are taken by whichever oven, and then driver, becomes free first, in order of arrival, which is what the
+    SimPy resources in PizzaRestaurant do.  All replications are advanced together, one order at a time, as rows of
+    NumPy arrays.  Returns the total delivery times as a (reps, orders) array, NaN where an order was not delivered
+    in time, and an array with the drivers' utilization rate of every replication."""
+    velocity = VELOCITY * 16.667  # converting from km/h to m/min
+    rows = np.arange(reps)
+    oven_free = np.zeros((reps, OVEN_CAPACITY))  # time at which each oven is next free
+    drivers_free = np.zeros((reps, number_of_drivers))  # time at which each driver is next back at the restaurant
+    total_time = []
+    drivers_utilization = []
+
+    # Replications whose orders have stopped keep "ordering" until all have stopped, but nothing after TIME is recorded
+    order_time = np.zeros(reps)
+    while (order_time < TIME).any():
+        oven = oven_free.argmin(axis=1)
+        cooked = np.maximum(order_time, oven_free[rows, oven]) + TIME_TO_COOK_PIZZA
+        oven_free[rows, oven] = cooked
+
+        driver = drivers_free.argmin(axis=1)
+        collected = np.maximum(cooked, drivers_free[rows, driver])
+        time_to_deliver = delivery_radius * 1000 * np.sqrt(np.random.random(reps)) / velocity
+        delivered = collected + time_to_deliver
+        finished = delivered + 2 + time_to_deliver
+        drivers_free[rows, driver] = finished
+
+        # Only what happens before the end of the simulation is recorded
+        total_time.append(np.where(delivered < TIME, delivered - order_time, np.nan))
+        drivers_utilization.append(np.where(finished < TIME, (cooked, finished), np.nan).T)
+
+        order_time += np.random.normal(order_rate, 0.7, reps)
+
+    # PizzaRestaurant records drivers as they come back, so order the time stamps by finishing time (NaN sorts last)
+    drivers_utilization = np.stack(drivers_utilization, axis=1)
+    by_finish = np.argsort(drivers_utilization[:, :, 1], axis=1)
+    drivers_utilization = np.take_along_axis(drivers_utilization, by_finish[:, :, None], axis=1)
+
+    return np.column_stack(total_time), utilization_rate(drivers_utilization)
 
 
 class PizzaRestaurant:
@@ -37,10 +85,13 @@ class PizzaRestaurant:
         self.delivery_radius = 0  # in km
         self.velocity = VELOCITY * 16.667  # converting from km/h to m/min
 
-        self.order_oven = []  # Time from order placement to pizza going in the oven
-        self.cooked_driver_pickup = []  # Time from pizza finished cooking until delivery driver collects it
-        self.total_time = []  # Time from order placement till customer receives pizza
-        self.pizza_temperature = []  # Temperature at delivery
+        # Collected times, with a slot per order that stays NaN until (unless) the time is recorded.  The arrays are
+        # allocated in runsim, once the arrival times of the orders are known
+        self.order_oven = np.empty(0)  # Time from order placement to pizza going in the oven
+        self.cooked_driver_pickup = np.empty(0)  # Time from pizza finished cooking until delivery driver collects it
+        self.total_time = np.empty(0)  # Time from order placement till customer receives pizza
+        self.pizza_temperature = np.empty(0)  # Temperature at delivery
+        self.number_of_orders = 0
         self.number_of_pizzas = 0
         self.delivered_pizzas = 0
 
@@ -53,89 +104,107 @@ class PizzaRestaurant:
         self.delivery_radius = delivery_radius * 1000
 
         env = simpy.Environment()
-        oven = simpy.Resource(env, capacity=OVEN_CAPACITY)
-        drivers = simpy.Resource(env, capacity=number_of_drivers)
-        env.process(self.pizza(env, oven, drivers))
+        # Ovens and drivers are min-heaps of the times at which each is next free.  Orders are served first come first
+        # served by whichever is free first, so no SimPy resource (and its request events) is needed.
+        oven = [0.0] * OVEN_CAPACITY
+        drivers = [0.0] * number_of_drivers
+
+        # Orders arrive at time 0 and then at normally distributed intervals, until TIME.  All arrival times are drawn
+        # up front (50% more than expected on average, topped up in the rare case that isn't enough)
+        arrivals = np.zeros(1)
+        while arrivals[-1] < TIME:
+            intervals = np.maximum(0, np.random.normal(order_rate, 0.7, int(TIME / order_rate * 1.5) + 1))
+            arrivals = np.concatenate([arrivals, arrivals[-1] + np.cumsum(intervals)])
+        arrivals = arrivals[arrivals < TIME]
+        self.number_of_orders = len(arrivals)
+
+        self.order_oven = np.full(self.number_of_orders, np.nan)
+        self.cooked_driver_pickup = self.order_oven.copy()
+        self.total_time = self.order_oven.copy()
+        self.pizza_temperature = self.order_oven.copy()
+
+        env.process(self.pizza(env, oven, drivers, arrivals.tolist()))
         env.run(until=TIME)
 
-    def pizza(self, env, oven, drivers):
-        """ Generates new orders"""
-        while True:
-            # yield env.timeout(random.normal(self.order_rate, 0.7))
-            env.process(self.order(env, oven, drivers))
-            yield env.timeout(np.random.normal(self.order_rate, 0.7))
+        # Keep only the times that were recorded before the end of the simulation
+        self.order_oven = self.order_oven[~np.isnan(self.order_oven)]
+        self.cooked_driver_pickup = self.cooked_driver_pickup[~np.isnan(self.cooked_driver_pickup)]
+        self.total_time = self.total_time[~np.isnan(self.total_time)]
+        self.pizza_temperature = self.pizza_temperature[~np.isnan(self.pizza_temperature)]
+
+    def pizza(self, env, oven, drivers, arrivals):
+        """ Places new orders at the given arrival times"""
+        for number, arrival in enumerate(arrivals):
+            yield env.timeout(arrival - env.now)
+            env.process(self.order(env, oven, drivers, number))
 
-    def order(self, env, oven, drivers):
+    def order(self, env, oven, drivers, number):
         """ Cooks pizza"""
         order_time = env.now
 
-        with oven.request() as request:
-            yield request
+        oven_time = max(heapq.heappop(oven), order_time)
+        heapq.heappush(oven, oven_time + TIME_TO_COOK_PIZZA)
+        yield env.timeout(oven_time - order_time)
 
-            oven_time = env.now
-            self.order_oven.append(oven_time - order_time)
-            yield env.timeout(TIME_TO_COOK_PIZZA)
-            cooked = env.now
+        self.order_oven[number] = oven_time - order_time
+        yield env.timeout(TIME_TO_COOK_PIZZA)
+        cooked = env.now
 
-            self.number_of_pizzas += 1
-            self.ovens_utilization.append((order_time, cooked))
+        self.number_of_pizzas += 1
+        self.ovens_utilization.append((order_time, cooked))
 
-            c = self.delivery(env, drivers, order_time, cooked)
-            env.process(c)
+        c = self.delivery(env, drivers, number, order_time, cooked)
+        env.process(c)
 
-    def delivery(self, env, drivers, order_time, cooked):
+    def delivery(self, env, drivers, number, order_time, cooked):
         """ Delivers pizza"""
         delivery_placed = env.now
 
-        with drivers.request() as request:
-            yield request
+        distance = self.delivery_radius * sqrt(random())
 
-            collected = env.now
-            self.cooked_driver_pickup.append(collected - cooked)
+        time_to_deliver = distance / self.velocity
 
-            distance = self.delivery_radius * sqrt(random())
+        collected = max(heapq.heappop(drivers), delivery_placed)
+        heapq.heappush(drivers, collected + time_to_deliver + 2 + time_to_deliver)
+        yield env.timeout(collected - delivery_placed)
 
-            time_to_deliver = distance / self.velocity
+        self.cooked_driver_pickup[number] = collected - cooked
 
-            yield env.timeout(time_to_deliver)
+        yield env.timeout(time_to_deliver)
 
-            delivered = env.now
-            self.total_time.append(delivered - order_time)
-            pizza_temp = PIZZA_TEMP - (delivered - cooked)
-            self.pizza_temperature.append(pizza_temp)
+        delivered = env.now
+        self.total_time[number] = delivered - order_time
+        pizza_temp = PIZZA_TEMP - (delivered - cooked)
+        self.pizza_temperature[number] = pizza_temp
 
-            yield env.timeout(2)
+        yield env.timeout(2)
 
-            self.delivered_pizzas += 1
+        self.delivered_pizzas += 1
 
-            yield env.timeout(time_to_deliver)
+        yield env.timeout(time_to_deliver)
 
-            finished = env.now
+        finished = env.now
 
-            self.drivers_utilization.append((delivery_placed, finished))
+        self.drivers_utilization.append((delivery_placed, finished))
 
     def statistic(self):
         """ Print and plot statistics"""
         print("Time from order placement to pizza going in the oven:", round(average(self.order_oven), 2))
         plt.figure(1)
-        plt.hist(self.order_oven)
-        plt.title("Time from order placement to pizza going in the oven")
+        histogram(self.order_oven, "Time from order placement to pizza going in the oven")
 
         print("Time from pizza finished cooking until delivery driver collects it:",
               round(average(self.cooked_driver_pickup), 2))
         plt.figure(2)
-        plt.hist(self.cooked_driver_pickup)
-        plt.title("Time from pizza finished cooking until delivery driver collects it")
+        histogram(self.cooked_driver_pickup, "Time from pizza finished cooking until delivery driver collects it")
 
         print("Total time from order placement to receiving pizza:", round(average(self.total_time), 2))
         plt.figure(3)
-        plt.hist(self.total_time)
-        plt.title("Total time from order placement to receiving pizza")
+        histogram(self.total_time, "Total time from order placement to receiving pizza")
 
         print("Temperature at delivery:", round(average(self.pizza_temperature), 2))
         plt.figure(4)
-        plt.hist(self.pizza_temperature)
-        plt.title("Temperature at delivery")
+        histogram(self.pizza_temperature, "Temperature at delivery")
         plt.show()
 
         print("Total number of pizzas cooked:", int(average(self.number_of_pizzas)))
@@ -153,33 +222,19 @@ if __name__ == '__main__':
 
     # part 1
     DELIVERED_WITHIN = 49
-    number_of_cases = 0  # number of cases when the delivery was made within 50 minutes
-    percentages = []  # we will run the simulation for 200 times, hence, we want to keep tracking of all percentages
-
-    for i in range(200):
-        sim = PizzaRestaurant()
-        sim.runsim(5, 5, 10)
-        for i in sim.total_time:
-            if i <= DELIVERED_WITHIN:
-                number_of_cases += 1
-        percentages.append(number_of_cases/len(sim.total_time))
-        number_of_cases = 0
+    # we will run the simulation for 200 times, hence, we want to keep tracking of all percentages of cases when the
+    # delivery was made within 50 minutes
+    total_times, _ = run_batch(200, 5, 5, 10)
+    percentages = (total_times <= DELIVERED_WITHIN).sum(axis=1) / (~np.isnan(total_times)).sum(axis=1)
 
     print("\n\nProbability of being delivered within", DELIVERED_WITHIN, "minutes:", round(average(percentages) * 100, 2))
 
     # part 2
     NUMBER_OF_DRIVERS = 7
 
-    drivers_util = []
-    for i in range(200):
-        sim = PizzaRestaurant()
-        sim.runsim(NUMBER_OF_DRIVERS, 5, 10)
-        for i in sim.total_time:
-            if i <= 30:
-                number_of_cases += 1
-        percentages.append(number_of_cases/len(sim.total_time))
-        number_of_cases = 0
-        drivers_util.append(utilization_rate(sim.drivers_utilization))
+    total_times, drivers_util = run_batch(200, NUMBER_OF_DRIVERS, 5, 10)
+    # the 30-minute percentages are added to part 1's, and the average below is taken over both
+    percentages = np.concatenate([percentages, (total_times <= 30).sum(axis=1) / (~np.isnan(total_times)).sum(axis=1)])
 
     print("\nProbability of being delivered within 30 minutes:", round(average(percentages) * 100, 2),
           "\nNumber of drivers required:", NUMBER_OF_DRIVERS,
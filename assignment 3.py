@@ -3,23 +3,34 @@ Simulation and animation of a sidewalk where infected agents can transmiss
 infection with a certain probability and in a certain distance.
 """
 
-import statistics
 from matplotlib import pyplot as plt, colors
 from matplotlib.animation import FuncAnimation
-import random
+import numpy as np
 
-rand = random.Random()
+nprand = np.random.default_rng()
 SIDEWALK_WIDTH = 10  # This is the y-dimension of the sidewalk
 SIDEWALK_LENGTH = 200  # This is the x-dimension of the sidewalk
 TRANSPROB = 0.1  # Probability of transmission of virus in 1 time step at distance 1
 INFECTED_PROP = 0.1  # The proportion of people who enter the simulation already carrying the virus
 INTERARRIVALS = 3  # Average number of time steps between arrivals (each side handled separately)
+NUM_STEPS = 1000  # Number of time steps the simulation runs for
+MAX_AGENTS = 2 * 3 * (NUM_STEPS // INTERARRIVALS + 1)  # Upper bound on agents entering (at most 3 per side per arrival)
+# The sidewalk grid stores agent indexes as int16
+assert MAX_AGENTS <= np.iinfo(np.int16).max, "Too many agents for the int16 sidewalk grid; reduce NUM_STEPS"
+
+# Probability of transmission in 1 time step to the square dx, dy away from an infected agent, kept in
+# RISK[dy + 2, dx + 2] for the squares within 'radius' 2: TRANSPROB times the risk factor 1/distance^2 (and nothing
+# to the agent's own square)
+RISK = np.array([[TRANSPROB / (dx * dx + dy * dy) if dx != 0 or dy != 0 else 0.0 for dx in range(-2, 3)]
+                 for dy in range(-2, 3)])
+# The same squares as a list of offsets, with the transmission probability of each
+NEIGHBOUR_DY, NEIGHBOUR_DX = np.argwhere(RISK).T - 2
+NEIGHBOUR_PROB = RISK[RISK > 0]
 
 # Setup for graphical display
 colourmap = colors.ListedColormap(["lightgrey", "green", "red", "yellow"])
 normalizer = colors.Normalize(vmin=0.0, vmax=3.0)
-
-all_agents = []
+REDRAW_EVERY = 1  # The display is updated every REDRAW_EVERY time steps; raise it to spend less time drawing
 
 
 # An agent representing a single person traversing the sidewalk.  Simple movement is demonstrated.  It is up
@@ -29,80 +40,70 @@ all_agents = []
 # cannot change their coordinates directly.  Instead, they must make movement requests to the sidewalk, which
 # (if the move is valid) updates the person's x and y coordinates.
 class Person:
-    def __init__(self, id, sidewalk, direction):
+    # The starting y coordinate and whether the person already carries the virus are drawn by the sidewalk, for all
+    # arriving people at once.
+    def __init__(self, id, sidewalk, direction, y, infected):
         self.id = id
         self.active = False
         self.sidewalk = sidewalk
-        self.infected = True if rand.random() <= INFECTED_PROP else False
-        self.newlyinfected = False
+        self.infected = infected  # carrying the virus on arrival; from then on the sidewalk tracks infection
         self.direction = direction
-        self.num_of_infections = 0  # number of agents that got infected by one agent
 
+        self.index = None  # position of this person in the sidewalk's per-agent arrays, set on entering
         self.x = None
-        self.y = rand.randint(0, SIDEWALK_WIDTH - 1)
+        self.y = y
 
     def enter_sidewalk(self, x, y):
         if self.sidewalk.enter_sidewalk(self, x, y):
             self.active = True
-            all_agents.append(self)
 
     # This is the method that is called by the simulation once for each time step.  It is during this call
     # that the agent is active and can take action: examining surroundings, attempting to move, etc.
     # This method should only be called when the agent's 'active' flag is true, but you might want to check here
     # as well for safety.
-
-    def step(self):
-        # Simple random movement in one of four cardinal directions (written for clarity, not efficiency!)
-        desiredx = self.x
-        desiredy = self.y
+    # The random numbers are drawn for all agents at once by the sidewalk: u is uniform on [0, 1) and picks the kind
+    # of move, d is -1 or 1 with equal probability and picks the side for a move to the left or right.
+
+    def step(self, u, d):
+        # Simple random movement in one of four cardinal directions.  The decision only picks the desired square;
+        # a single move is attempted at the end.
+        x = self.x
+        y = self.y
+        direction = self.direction
+        grid = self.sidewalk.storage.grid  # index of the occupant of each square, -1 if empty
+        desiredx = x
+        desiredy = y
 
         # leave the sidewalk if an agent reached the end
-        if (self.x == 0 and self.direction == -1) or (self.x == SIDEWALK_LENGTH - 1 and self.direction == 1):
+        if (x == 0 and direction == -1) or (x == SIDEWALK_LENGTH - 1 and direction == 1):
             self.sidewalk.leave_sidewalk(self)
+            return
 
-        # if there is an agent in from of the current agent
-        elif self.sidewalk.storage.get_item(self.x + self.direction, self.y) is not None:
+        # if there is an agent in from of the current agent (the square is on the sidewalk, or the agent would leave)
+        if grid[y, x + direction] >= 0:
             # move right or left with the same probability
-            change_y = random.choices([-1, 1], [0.5, 0.5])[0]
-            desiredy = self.y + change_y
-            desiredy = max(min(desiredy, SIDEWALK_WIDTH - 1), 0)
-            self.sidewalk.attemptmove(self, desiredx, desiredy)
+            desiredy = y + d
 
         # if there is an agent to the right or to the left side of the current agent
-        elif self.sidewalk.storage.get_item(self.x, self.y + 1) \
-                or self.sidewalk.storage.get_item(self.x, self.y - 1) is not None:
-            # move forward, left or right
-            change = random.choices(["forward", "left or right"], [0.6, 0.4])[0]
-            if change == "forward":
-                desiredx = self.x + self.direction
-                desiredx = max(min(desiredx, SIDEWALK_LENGTH - 1), 0)
-                self.sidewalk.attemptmove(self, desiredx, desiredy)
-            elif change == "left or right":
-                change_y = random.choices([-1, 1], [0.5, 0.5])[0]
-                desiredy = self.y + change_y
-                desiredy = max(min(desiredy, SIDEWALK_WIDTH - 1), 0)
-                self.sidewalk.attemptmove(self, desiredx, desiredy)
+        elif (y < SIDEWALK_WIDTH - 1 and grid[y + 1, x] >= 0) or (y > 0 and grid[y - 1, x] >= 0):
+            # move forward (60%), left or right (40%)
+            if u < 0.6:
+                desiredx = x + direction
+            else:
+                desiredy = y + d
 
         # get to this point only if there is no neighbour agents
         else:
-            change = random.choices(["forward", "back", "left or right"], [0.7, 0.1, 0.2])[0]
-
-            if change == "forward":
-                desiredx = self.x + self.direction
-
-            elif change == "back":
-                if self.direction == 1:
-                    desiredx = self.x - 1
-                elif self.direction == -1:
-                    desiredx = self.x + 1
-
-            elif change == "left or right":
-                change_y = random.choices([-1, 1], [0.5, 0.5])[0]
-                desiredy = self.y + change_y
-
-            # Ensure x and y don't go off edge of sidewalk
-            desiredx = max(min(desiredx, SIDEWALK_LENGTH - 1), 0)
-            desiredy = max(min(desiredy, SIDEWALK_WIDTH - 1), 0)
+            # move forward (70%), back (10%), left or right (20%)
+            if u < 0.7:
+                desiredx = x + direction
+            elif u < 0.8:
+                desiredx = x - direction
+            else:
+                desiredy = y + d
+
+        # A move off the edge of the sidewalk stays put (the agent's own square is never free), so isn't attempted
+        if 0 <= desiredx < SIDEWALK_LENGTH and 0 <= desiredy < SIDEWALK_WIDTH:
             self.sidewalk.attemptmove(self, desiredx, desiredy)
 
     def __str__(self):
@@ -117,8 +118,15 @@ class Sidewalk:
         # Tracking of positions of agents
         self.storage = SWGrid()
 
-        # Bitmap is for graphical display
-        self.bitmap = [[0.0 for i in range(SIDEWALK_LENGTH)] for j in range(SIDEWALK_WIDTH)]
+        # Per-agent state, indexed by each person's index, so infection can be computed on whole arrays at once
+        self.xs = np.zeros(MAX_AGENTS, np.int16)
+        self.ys = np.zeros(MAX_AGENTS, np.int16)
+        self.infected = np.zeros(MAX_AGENTS, np.uint8)
+        self.newlyinfected = np.zeros(MAX_AGENTS, np.uint8)
+        self.infections = np.zeros(MAX_AGENTS, np.int32)  # number of agents that got infected by each agent
+
+        # Bitmap is for graphical display; it is allocated once and redrawn in place
+        self.bitmap = np.zeros((SIDEWALK_WIDTH, SIDEWALK_LENGTH), np.uint8)
 
     # An agent must enter the sidewalk at one of the ends (i.e., with an x coordinate of either zero or
     # the maximum.  They may attempt to enter at any y coordinate.  The function returns true if successful, false
@@ -137,6 +145,9 @@ class Sidewalk:
         self.storage.add_item(x, y, person)
         person.x = x
         person.y = y
+        self.xs[person.index] = x
+        self.ys[person.index] = y
+        self.infected[person.index] = person.infected
         return True
 
     # An agent must leave the sidewalk at one of the ends (i.e., with an x coordinate of either zero or
@@ -166,54 +177,62 @@ class Sidewalk:
         if self.storage.isoccupied(x, y):
             # print("Move rejected: occupied")
             return False
+        # The grid finds the person by their current coordinates, so move them there before updating x and y
+        self.storage.move_item(x, y, person)
         person.x = x
         person.y = y
-        self.storage.move_item(x, y, person)
+        self.xs[person.index] = x
+        self.ys[person.index] = y
         return True
 
     # When called, infects new agents (with some probability) who are in proximity to infected agents.  The risk
     # is equal to the simulation parameter at distance of 1, and decreases with greater distance.
     # You may add to this function, e.g., for gathering data, but do not modify the actual determination of infection.
     def spread_infection(self):
-        for person in self.storage.get_list():
-            currentx = person.x
-            currenty = person.y
-            if person.infected:
-                # Find all agents within a square of 'radius' 2 of the infected agent
-                for x in range(currentx - 2, currentx + 3):
-                    for y in range(currenty - 2, currenty + 3):
-                        target = self.storage.get_item(x, y)
-
-                        # If target is not infected, infect with probability dependent on distance
-                        if target is not None and not target.infected:
-                            riskfactor = 1 / ((currentx - x) ** 2 + (currenty - y) ** 2)
-                            tranmission_prob = TRANSPROB * riskfactor
-                            if rand.random() < tranmission_prob:
-                                person.num_of_infections += 1
-                                target.infected = True
-                                target.newlyinfected = True
-                                print('New infection! %s' % target)
+        agents = self.storage.get_list()
+        index = np.array([person.index for person in agents], dtype=np.intp)
+
+        # Find all agents within a square of 'radius' 2 of every agent, one row per agent (-1 where there is none)
+        x = self.xs[index, None] + NEIGHBOUR_DX
+        y = self.ys[index, None] + NEIGHBOUR_DY
+        onsidewalk = (x >= 0) & (x < SIDEWALK_LENGTH) & (y >= 0) & (y < SIDEWALK_WIDTH)
+        targets = np.where(onsidewalk, self.storage.grid[y.clip(0, SIDEWALK_WIDTH - 1),
+                                                         x.clip(0, SIDEWALK_LENGTH - 1)], -1)
+
+        # Each (agent, target) pair gets a single draw, so only pairs whose draw is below the transmission
+        # probability can ever lead to an infection.  Those are few, and are resolved in agent order below, so that
+        # agents infected earlier in this step still pass the infection on, exactly as when checking agent by agent.
+        susceptible = (targets >= 0) & (self.infected[targets] == 0)
+        rows, cols = np.nonzero(susceptible & (nprand.random(targets.shape) < NEIGHBOUR_PROB))
+
+        for row, col in zip(rows, cols):
+            person = agents[row]
+            t = targets[row, col]
+            # If target is not infected, infect with probability dependent on distance
+            if self.infected[person.index] and not self.infected[t]:
+                target = self.storage.items[t]
+                self.infected[t] = 1
+                self.newlyinfected[t] = 1
+                self.infections[person.index] += 1
+                print('New infection! %s' % target)
 
     # Updates the graphic for display
     def refresh_image(self):
-        self.bitmap = [[0.0 for i in range(SIDEWALK_LENGTH)] for j in range(SIDEWALK_WIDTH)]
-        for person in self.storage.get_list():
-            x = person.x
-            y = person.y
-            colour = 1
-            if person.newlyinfected:
-                colour = 3
-            elif person.infected:
-                colour = 2
-            self.bitmap[y][x] = colour
+        index = np.array([person.index for person in self.storage.get_list()], dtype=np.intp)
+        colour = np.where(self.newlyinfected[index], 3, np.where(self.infected[index], 2, 1))
+        self.bitmap.fill(0)
+        self.bitmap[self.ys[index], self.xs[index]] = colour
 
     # Function that is called at each time step, to execute the step.  Calls the step() function of every active
-    # agent, spreads infection after the agents have moved, and updates the image for display.  You will need to add
-    # code here to, for example, have new agents enter.
+    # agent, spreads infection after the agents have moved, and updates the image for display (every REDRAW_EVERY
+    # steps).  You will need to add code here to, for example, have new agents enter.
     def run_step(self, time_step):
-        for person in self.storage.get_list():
+        agents = self.storage.get_list()
+        u = nprand.random(len(agents)).tolist()
+        d = (nprand.integers(0, 2, len(agents)) * 2 - 1).tolist()
+        for person, u_i, d_i in zip(agents, u, d):
             if person.active:
-                person.step()
+                person.step(u_i, d_i)
 
         if time_step % INTERARRIVALS == 0:
             # every 3rd time_stamp
@@ -221,13 +240,16 @@ class Sidewalk:
             self.new_agents(time_step, -1, SIDEWALK_LENGTH - 1)
 
         self.spread_infection()
-        self.refresh_image()
+        if time_step % REDRAW_EVERY == 0:
+            self.refresh_image()
 
     def new_agents(self, time_step, direction, starting_point):
         """ Add new agents (between 1 and 3 every time the function is called)"""
-        num = random.randint(1, 3)
-        personlist = [Person(time_step, sw, direction) for _ in range(num)]
-        for person in personlist:
+        num = nprand.integers(1, 4)
+        ys = nprand.integers(0, SIDEWALK_WIDTH, num).tolist()
+        infected = (nprand.random(num) <= INFECTED_PROP).tolist()
+        for y, carrier in zip(ys, infected):
+            person = Person(time_step, self, direction, y, carrier)
             person.enter_sidewalk(starting_point, person.y)
 
     # Returns true if x,y is occupied by an agent, false otherwise.  This is the only information that an agent
@@ -236,52 +258,65 @@ class Sidewalk:
         return self.storage.isoccupied(x, y)
 
 
-# Used to provide storage, lookup of occupants of sidewalk
+# Used to provide storage, lookup of occupants of sidewalk.  The grid is a 2-D array indexed [y, x] holding the index
+# of the occupying item (or -1 if empty); each item's own x, y coordinates are used to find it again, so every
+# operation is a single array access.
 class SWGrid:
     def __init__(self):
-        self.dic = dict()
+        # int16 holds any agent index (checked against MAX_AGENTS above) and keeps the grid small: a whole 5x5
+        # neighbourhood lies within a few cache lines
+        self.grid = np.full((SIDEWALK_WIDTH, SIDEWALK_LENGTH), -1, dtype=np.int16)
+        self.items = []  # every item ever stored; an item's index is its position in this list
+        # Items currently stored, by index, so get_list() doesn't have to scan the whole grid and an item can be
+        # dropped without searching for it
+        self._agents = {}
 
     def isoccupied(self, x, y):
         # self.check_coordinates(x, y)
-        return (x, y) in self.dic
+        if x < 0 or x >= SIDEWALK_LENGTH or y < 0 or y >= SIDEWALK_WIDTH:
+            return False
+        return self.grid[y, x] >= 0
 
     # Stores item at coordinates x, y.  Throws an exception if the coordinates are invalid.  Returns false if
     # unsuccessful (e.g., the square is occupied) or true if successful.
     def add_item(self, x, y, item):
         self.check_coordinates(x, y)
-        if (x, y) in self.dic:
+        if self.grid[y, x] >= 0:
             return False
-        self.dic[(x, y)] = item
+        if item.index is None:
+            item.index = len(self.items)
+            self.items.append(item)
+        self.grid[y, x] = item.index
+        self._agents[item.index] = item
         return True
 
-    # Removes item from its current coordinates (which do not need to be provided) and stores it
-    # at coordinates x, y.  Throws an exception if the coordinates are invalid or if the square is occupied.
+    # Removes item from its current coordinates (which do not need to be provided; the item's own x, y are used) and
+    # stores it at coordinates x, y.  Throws an exception if the coordinates are invalid or if the square is occupied.
     def move_item(self, x, y, item):
         self.check_coordinates(x, y)
-        if self.isoccupied(x, y):
+        if self.grid[y, x] >= 0:
             raise Exception("Move to occupied square!")
-
-        # Find and remove previous location.  Assumed state is valid (meaning only one entry per x,y key)
-        oldloc = next(key for key, value in self.dic.items() if value == item)
-        del self.dic[oldloc]
-        self.add_item(x, y, item)
+        self.grid[item.y, item.x] = -1
+        self.grid[y, x] = item.index
 
     # Removes item (coordinates do not need to be provided)
     # Throws an exception if the item doesn't exist.
     def remove_item(self, item):
-        # Find and remove previous location.  Assumed state is valid (meaning only one entry per x,y key)
-        oldloc = next(key for key, value in self.dic.items() if value == item)
-        if oldloc is None:
+        if self.get_item(item.x, item.y) is not item:
             raise Exception('Attempt to remove non-existent item!')
-        del self.dic[oldloc]
+        self.grid[item.y, item.x] = -1
+        del self._agents[item.index]
 
     def get_item(self, x, y):
-        # self.check_coordinates(x, y)
-        return self.dic.get((x, y), None)
+        # Coordinates off the sidewalk are simply empty (negative indexes would otherwise wrap around the array)
+        if x < 0 or x >= SIDEWALK_LENGTH or y < 0 or y >= SIDEWALK_WIDTH:
+            return None
+        index = self.grid[y, x]
+        return self.items[index] if index >= 0 else None
 
     # Returns a list of all agents in the simulation.
     def get_list(self):
-        return list(self.dic.values())
+        return list(self._agents.values())
 
     def check_coordinates(self, x, y):
         if x < 0 or x >= SIDEWALK_LENGTH or y < 0 or y >= SIDEWALK_WIDTH:
@@ -312,8 +347,8 @@ def updatefigure(*args):
     if t % 100 == 0:
         print("Time: %d" % t)
     sw.run_step(t)
-    sw.refresh_image()
-    image.set_array(sw.bitmap)
+    if t % REDRAW_EVERY == 0:
+        image.set_array(sw.bitmap)
     return image,
 
 
@@ -321,22 +356,20 @@ def updatefigure(*args):
 # run for 1000 steps.  After this point, it will simply stop, but the window will remain open.  You can close
 # the window to proceed to the code below these lines (where you could add, for example, output of your statistics.
 #
-# You can change the speed of the simulation by changing the interval, and the duration by changing frames.
-anim = FuncAnimation(display, updatefigure, frames=1000, interval=100, blit=True, repeat=False)
+# You can change the speed of the simulation by changing the interval, and the duration by changing NUM_STEPS.
+anim = FuncAnimation(display, updatefigure, frames=NUM_STEPS, interval=100, blit=True, repeat=False)
 plt.show()
 
 print("Done!")
 
 
 def print_statistics():
-    num_of_agents = 0
-    num_infected_agents = []
-    for i in all_agents:
-        num_of_agents += 1
-        if i.infected:
-            num_infected_agents.append(i.num_of_infections)
-    print("One infected agent got", round(statistics.mean(num_infected_agents), 3), "agents infected on average.\n"
-          "STDEV:", round(statistics.stdev(num_infected_agents), 3))
+    # Every agent that entered the sidewalk has an index, given in order of entering
+    num_of_agents = len(sw.storage.items)
+    infected = sw.infected[:num_of_agents] == 1
+    num_infected_agents = sw.infections[:num_of_agents][infected]
+    print("One infected agent got", round(num_infected_agents.mean(), 3), "agents infected on average.\n"
+          "STDEV:", round(num_infected_agents.std(ddof=1), 3))
 
     print("Overall number of infected agents divided by the total number of agents:",
           round(len(num_infected_agents)/num_of_agents, 3))